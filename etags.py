@@ -0,0 +1,61 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+
+def make_etag(body: bytes) -> str:
+    """Strong validator for a response body."""
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # GZipMiddleware leaves tags alone, but proxies may weaken them
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def json_entity(data) -> tuple[bytes, str]:
+    """Serialize `data` once and tag it, for caches that serve it repeatedly."""
+    body = JSONResponse(data).body
+    return body, make_etag(body)
+
+
+def entity_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    media_type: str = "application/json",
+) -> Response:
+    """
+    Serve a pre-serialized body under its precomputed ETag. A matching
+    If-None-Match gets a bodyless 304 without touching the body at all.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def conditional_response(
+    request: Request,
+    response: Response,
+    headers: Optional[dict] = None,
+) -> Response:
+    """
+    Tag a rendered 200 response with an ETag of its body and swap it for
+    a bodyless 304 when the client already holds that version.
+    """
+    if response.status_code != 200:
+        return response
+    tagged = {"ETag": make_etag(response.body), "Cache-Control": "no-cache"}
+    tagged.update(headers or {})
+    if etag_matches(request, tagged["ETag"]):
+        return Response(status_code=304, headers=tagged)
+    response.headers.update(tagged)
+    return response
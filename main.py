@@ -1,26 +1,75 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import  FastAPI, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from routers.auth import OptionalUserRoleDep
 
 
-from db import create_db_and_tables
+from db import create_db_and_tables, engine
+from etags import etag_matches, make_etag
+from security import calibrate_password_hashing
+from templating import templates
 from routers import users, items, auth, requests, pages, ui
 
-app = FastAPI(title="ShareLine")
+logger = logging.getLogger(__name__)
 
+# Landing page for logged-out visitors; identical for all of them,
+# so it is rendered once at startup.
+_landing_page = b""
+_landing_etag = ""
+
+
+def _render_landing_page() -> None:
+    global _landing_page, _landing_etag
+    _landing_page = templates.get_template("index.html").render(
+        request=None, current_user=None, current_role=None
+    ).encode()
+    _landing_etag = make_etag(_landing_page)
+
+
+def _check_unique_routes(app: FastAPI) -> None:
+    # A router included twice would register every endpoint twice and
+    # leave the first copy silently shadowing the second.
+    seen = set()
+    for route in app.routes:
+        for method in getattr(route, "methods", None) or ():
+            key = (method, route.path)
+            if key in seen:
+                raise RuntimeError(f"Duplicate route: {method} {route.path}")
+            seen.add(key)
 
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
 
-@app.on_event("startup")
-def on_startup() -> None:
-    create_db_and_tables()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _check_unique_routes(app)
+    await create_db_and_tables()
+    calibrate_password_hashing()
+    # Compile every template up front instead of on first request
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+    _render_landing_page()
+    yield
+
+
+app = FastAPI(title="ShareLine", lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+app.add_exception_handler(auth.PageRedirect, auth.page_redirect_handler)
+
+
+@app.exception_handler(Exception)
+async def log_pool_on_error(request: Request, exc: Exception):
+    # Pool exhaustion shows up as 500s; record how full it was
+    logger.error("%s %s failed; db pool: %s", request.method, request.url.path, engine.pool.status())
+    return PlainTextResponse("Internal Server Error", status_code=500)
+
+app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
 @app.get("/", response_class=HTMLResponse)
-def read_root(
+async def read_root(
     request: Request,
     current: OptionalUserRoleDep,
 ):
@@ -34,15 +83,14 @@ def read_root(
         if role == "affected":
             return RedirectResponse(url="/affected", status_code=303)
 
-    # ⭐ If not logged in, show landing page
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "current_user": user,
-            "current_role": role,
-        },
-    )
+    # ⭐ If not logged in, show landing page.
+    # "no-cache" makes browsers revalidate every time (a cached copy
+    # would hide the dashboard redirect right after login), but an
+    # unchanged page only costs a bodyless 304.
+    headers = {"ETag": _landing_etag, "Cache-Control": "no-cache", "Vary": "Cookie"}
+    if etag_matches(request, _landing_etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=_landing_page, headers=headers)
 
 app.include_router(auth.router)
 app.include_router(users.router, prefix="/users")
@@ -1,11 +1,11 @@
 from typing import Optional
 
-from sqlmodel import Field, SQLModel
+from sqlmodel import Field, Index, SQLModel
 
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    email: str
+    email: str = Field(index=True, unique=True)
     name: str
     is_donor: bool = False
     is_affected: bool = False
@@ -13,6 +13,13 @@ class User(SQLModel, table=True):
 
 
 class Item(SQLModel, table=True):
+    # Backs the "same batch already exists?" lookup in create_item and,
+    # via its donor_id prefix, every "items of this donor" query.
+    # description is left out, the other columns are selective enough.
+    __table_args__ = (
+        Index("ix_item_donor_dedup", "donor_id", "name", "category", "location"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     donor_id: int = Field(foreign_key="user.id")
 
@@ -24,9 +31,18 @@ class Item(SQLModel, table=True):
     status: str = "Available"
 
 
-class Request(SQLModel, table=True):
+class ItemRequest(SQLModel, table=True):
+    # Named ItemRequest so it can't shadow fastapi.Request in routers;
+    # the table keeps its original name.
+    __tablename__ = "request"
+    # (item_id, status) answers the "pending requests for this item?"
+    # check from the index alone and also serves plain item_id filters.
+    __table_args__ = (
+        Index("ix_request_item_status", "item_id", "status"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    requester_id: int = Field(foreign_key="user.id")
+    requester_id: int = Field(foreign_key="user.id", index=True)
     item_id: int = Field(foreign_key="item.id")
 
     requested_quantity: int
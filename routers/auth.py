@@ -1,27 +1,84 @@
+import hashlib
+import logging
+import os
 import secrets
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import Annotated, Optional
 
+from cachetools import TTLCache
 from db import SessionDep
 from fastapi import APIRouter, Cookie, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from itsdangerous import URLSafeTimedSerializer
 from models import User
-from passlib.context import CryptContext
 from schemas import LoginData, UserCreate, UserRead
-from sqlmodel import select
+from security import pwd_context
+from sqlmodel import select, update
+from templating import templates
 
 router = APIRouter(tags=["auth"])
-templates = Jinja2Templates(directory="templates")
 
-SECRET_KEY = secrets.token_hex(32)
-serializer = URLSafeTimedSerializer(SECRET_KEY)
+logger = logging.getLogger(__name__)
+
+SESSION_SECRET_FILE = ".session_secret"
+
+
+def _write_secret_file() -> None:
+    """
+    Publish a fresh key at SESSION_SECRET_FILE. It is written to a temp
+    file first and hard-linked into place, so the key file is never seen
+    half-written and, if several workers race, the first link wins.
+    """
+    directory = os.path.dirname(os.path.abspath(SESSION_SECRET_FILE))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".session_secret.")  # mode 0600
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, SESSION_SECRET_FILE)
+        except FileExistsError:
+            pass  # another worker published its key first; use that one
+    finally:
+        os.unlink(tmp_path)
+
+
+def _load_secret_key() -> str:
+    """
+    Signing key shared by every worker and kept across restarts, so
+    deploys don't log everyone out. Set SESSION_SECRET in production;
+    in dev a key is generated once into SESSION_SECRET_FILE.
+    """
+    secret = os.getenv("SESSION_SECRET")
+    if secret is not None:
+        if not secret.strip():
+            raise RuntimeError("SESSION_SECRET is set but empty")
+        return secret
+
+    logger.warning(
+        "SESSION_SECRET is not set; signing sessions with the key in %s. "
+        "Set SESSION_SECRET in production.",
+        os.path.abspath(SESSION_SECRET_FILE),
+    )
+    if not os.path.exists(SESSION_SECRET_FILE):
+        _write_secret_file()
+
+    with open(SESSION_SECRET_FILE) as f:
+        secret = f.read().strip()
+    # An empty key would let anyone sign their own session cookies
+    if not secret:
+        raise RuntimeError(
+            f"{SESSION_SECRET_FILE} is empty; delete it or set SESSION_SECRET"
+        )
+    return secret
 
 
-pwd_context = CryptContext(
-    schemes=["pbkdf2_sha256"],
-    deprecated="auto",
-)
+SECRET_KEY = _load_secret_key()
+serializer = URLSafeTimedSerializer(SECRET_KEY)
 
 
 def hash_password(password: str) -> str:
@@ -32,6 +89,64 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+@lru_cache(maxsize=1)
+def _dummy_password_hash() -> str:
+    """
+    Hash checked when the email is unknown, so /login does the same
+    KDF work whether or not the account exists. Built lazily so it
+    uses the parameters chosen by the startup calibration.
+    """
+    return hash_password("unused-dummy-password")
+
+
+@dataclass(frozen=True)
+class SessionUser:
+    """
+    Detached snapshot of the logged-in user, safe to keep in the
+    session cache. Load the `User` row when you need to modify it.
+    """
+    id: int
+    email: str
+    name: str
+    is_donor: bool
+    is_affected: bool
+
+
+# Signed cookie -> (SessionUser, role). TTLCache is not thread-safe, so
+# every reader and writer (the dependencies below, logout, account
+# deletion) must be async and run on the event loop, never in the threadpool.
+_session_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+
+def _session_cache_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _cache_session(token: str, user: User, role: str) -> dict:
+    session_user = SessionUser(
+        id=user.id,
+        email=user.email,
+        name=user.name,
+        is_donor=user.is_donor,
+        is_affected=user.is_affected,
+    )
+    _session_cache[_session_cache_key(token)] = (session_user, role)
+    return {"user": session_user, "role": role}
+
+
+def _cached_session(token: str) -> Optional[dict]:
+    cached = _session_cache.get(_session_cache_key(token))
+    if cached is None:
+        return None
+    return {"user": cached[0], "role": cached[1]}
+
+
+def forget_session(token: Optional[str]) -> None:
+    """Drop a session token from the cache (logout / account deletion)."""
+    if token is not None:
+        _session_cache.pop(_session_cache_key(token), None)
+
+
 def create_session_token(user_id: int, role: str) -> str:
     """
     Store user_id + role in the signed token.
@@ -53,35 +168,86 @@ def verify_session_token(token: str, max_age_seconds: int = 60 * 60 * 8):
         return None
 
 
-def get_current_user_and_role(
+async def get_session_role(
+    session_token: Optional[str] = Cookie(default=None, alias="session"),
+) -> str:
+    """
+    Returns the role from the signed session cookie alone, without
+    loading the user, so role checks can fail before any DB work.
+    Raises 401 if not logged in / invalid.
+    """
+    if session_token is None:
+        raise HTTPException(status_code=401, detail="Not logged in")
+
+    cached = _cached_session(session_token)
+    if cached is not None:
+        return cached["role"]
+
+    data = verify_session_token(session_token)
+    if not data:
+        raise HTTPException(
+            status_code=401, detail="Invalid or expired session")
+    return data["role"]
+
+
+SessionRoleDep = Annotated[str, Depends(get_session_role)]
+
+
+async def _load_session_user(
+    session: SessionDep, token: str
+) -> tuple[Optional[dict], Optional[User]]:
+    """
+    Cache-miss path shared by the session dependencies: verify the
+    signature (a single HMAC) and only then load the user.
+    Returns (token data, user); either may be None.
+    """
+    data = verify_session_token(token)
+    if not data:
+        return None, None
+    return data, await session.get(User, data["user_id"])
+
+
+async def get_current_user_and_role(
+    request: Request,
     session: SessionDep,
     session_token: Optional[str] = Cookie(default=None, alias="session"),
 ) -> dict:
     """
     Reads the 'session' cookie, verifies the token,
-    looks up the user, and returns {"user": User, "role": str}.
+    looks up the user, and returns {"user": SessionUser, "role": str}.
     Raises 401 if not logged in / invalid.
+    The result is memoized on request.state for the rest of the request.
     """
     if session_token is None:
         raise HTTPException(status_code=401, detail="Not logged in")
 
-    data = verify_session_token(session_token)
+    current = getattr(request.state, "current_user", None)
+    if current is not None:
+        return current
+
+    cached = _cached_session(session_token)
+    if cached is not None:
+        request.state.current_user = cached
+        return cached
+
+    data, user = await _load_session_user(session, session_token)
     if not data:
         raise HTTPException(
             status_code=401, detail="Invalid or expired session")
 
-    user = session.get(User, data["user_id"])
     if user is None:
         raise HTTPException(
             status_code=401, detail="User not found for this session")
 
-    return {"user": user, "role": data["role"]}
+    request.state.current_user = _cache_session(session_token, user, data["role"])
+    return request.state.current_user
 
 
 CurrentUserRoleDep = Annotated[dict, Depends(get_current_user_and_role)]
 
 
-def get_optional_user_and_role(
+async def get_optional_user_and_role(
+    request: Request,
     session: SessionDep,
     session_token: Optional[str] = Cookie(default=None, alias="session"),
 ) -> Optional[dict]:
@@ -93,15 +259,21 @@ def get_optional_user_and_role(
     if session_token is None:
         return None
 
-    data = verify_session_token(session_token)
-    if not data:
-        return None
+    current = getattr(request.state, "current_user", None)
+    if current is not None:
+        return current
+
+    cached = _cached_session(session_token)
+    if cached is not None:
+        request.state.current_user = cached
+        return cached
 
-    user = session.get(User, data["user_id"])
+    data, user = await _load_session_user(session, session_token)
     if user is None:
         return None
 
-    return {"user": user, "role": data["role"]}
+    request.state.current_user = _cache_session(session_token, user, data["role"])
+    return request.state.current_user
 
 
 OptionalUserRoleDep = Annotated[Optional[dict],
@@ -109,7 +281,7 @@ OptionalUserRoleDep = Annotated[Optional[dict],
 
 
 @router.get("/login", response_class=HTMLResponse)
-def login_page(
+async def login_page(
     request: Request,
     current: OptionalUserRoleDep,
 ):
@@ -129,7 +301,7 @@ def login_page(
 
 
 @router.get("/register", response_class=HTMLResponse)
-def register_page(
+async def register_page(
     request: Request,
     current: OptionalUserRoleDep,
 ):
@@ -155,9 +327,9 @@ async def register(request: Request, session: SessionDep):
     Register a new user with a hashed password.
     Accepts either JSON (API/Swagger) or form-data (from HTML form).
     """
-    content_type = request.headers.get("content-type", "")
+    is_json = request.headers.get("content-type", "").startswith("application/json")
 
-    if content_type.startswith("application/json"):
+    if is_json:
         data = await request.json()
         user_in = UserCreate(**data)
 
@@ -200,12 +372,12 @@ async def register(request: Request, session: SessionDep):
             is_affected=is_affected,
         )
 
-    existing = session.exec(
-        select(User).where(User.email == user_in.email)
+    existing = (
+        await session.exec(select(User.id).where(User.email == user_in.email))
     ).first()
 
     if existing:
-        if content_type.startswith("application/json"):
+        if is_json:
             raise HTTPException(status_code=400, detail="Email already registered")
 
         return templates.TemplateResponse(
@@ -219,7 +391,8 @@ async def register(request: Request, session: SessionDep):
             status_code=400,
         )
 
-    password_hash = hash_password(user_in.password)
+    # The KDF is deliberately slow; keep it off the event loop
+    password_hash = await run_in_threadpool(hash_password, user_in.password)
 
     user = User(
         email=user_in.email,
@@ -230,8 +403,8 @@ async def register(request: Request, session: SessionDep):
     )
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
 
     if user.id is None:
         raise HTTPException(
@@ -240,7 +413,7 @@ async def register(request: Request, session: SessionDep):
 
     token = create_session_token(user.id, role)
 
-    if content_type.startswith("application/json"):
+    if is_json:
         resp = JSONResponse({"message": "Registration successful", "role": role})
     else:
         resp = RedirectResponse(url="/", status_code=303)
@@ -267,9 +440,9 @@ async def login(request: Request, session: SessionDep, response: Response):
 
     Accepts either JSON (API/Swagger) or form-data (from HTML form).
     """
-    content_type = request.headers.get("content-type", "")
+    is_json = request.headers.get("content-type", "").startswith("application/json")
 
-    if content_type.startswith("application/json"):
+    if is_json:
         data = await request.json()
         payload = LoginData(**data)
     else:
@@ -291,19 +464,31 @@ async def login(request: Request, session: SessionDep, response: Response):
                             role=role)  # type: ignore
 
     try:
-        user = session.exec(
-            select(User).where(User.email == payload.email)
+        # Only the columns the login check needs, no ORM instance
+        user = (
+            await session.exec(
+                select(User.id, User.password_hash, User.is_donor, User.is_affected)
+                .where(User.email == payload.email)
+            )
         ).first()
 
-        if user is None:
+        if user is not None:
+            hashed = user.password_hash
+        else:
+            hashed = await run_in_threadpool(_dummy_password_hash)
+        password_ok = await run_in_threadpool(verify_password, payload.password, hashed)
+
+        if user is None or not password_ok:
             raise HTTPException(
                 status_code=400, detail="Invalid email or password"
             )
 
-        if not verify_password(payload.password, user.password_hash):
-            raise HTTPException(
-                status_code=400, detail="Invalid email or password"
+        if pwd_context.needs_update(user.password_hash):
+            new_hash = await run_in_threadpool(hash_password, payload.password)
+            await session.exec(
+                update(User).where(User.id == user.id).values(password_hash=new_hash)
             )
+            await session.commit()
 
         if payload.role == "donor" and not user.is_donor:
             raise HTTPException(
@@ -322,7 +507,7 @@ async def login(request: Request, session: SessionDep, response: Response):
 
         token = create_session_token(user.id, payload.role)
 
-        if request.headers.get("content-type", "").startswith("application/json"):
+        if is_json:
             response.set_cookie(
                 key="session",
                 value=token,
@@ -345,7 +530,7 @@ async def login(request: Request, session: SessionDep, response: Response):
         return resp
 
     except HTTPException as exc:
-        if request.headers.get("content-type", "").startswith("application/json"):
+        if is_json:
             raise
 
         user = None
@@ -363,10 +548,11 @@ async def login(request: Request, session: SessionDep, response: Response):
 
 
 @router.post("/logout")
-def logout():
+async def logout(session_token: Optional[str] = Cookie(default=None, alias="session")):
     """
     Clear the session cookie and redirect to home.
     """
+    forget_session(session_token)
     response = RedirectResponse(url="/", status_code=303)
     response.delete_cookie("session")
     return response
@@ -389,7 +575,7 @@ def read_me(current: CurrentUserRoleDep):
     }
 
 
-def require_auth(
+async def require_auth(
     user_and_role: Optional[dict] = Depends(get_current_user_and_role),
 ) -> dict:
     if user_and_role is None:
@@ -399,43 +585,30 @@ def require_auth(
 
 UserRoleDep = Annotated[dict, Depends(require_auth)]
 
-@router.get("/donor", include_in_schema=False)
-def donor_dashboard(
-    request: Request,
-    current: CurrentUserRoleDep,
-):
-    user = current["user"]
-    role = current["role"]
 
-    if role != "donor":
-        return RedirectResponse(url="/", status_code=303)
+class PageRedirect(Exception):
+    """Raised by page dependencies to send the browser elsewhere (303)."""
 
-    return templates.TemplateResponse(
-        "donor_dashboard.html",
-        {
-            "request": request,
-            "current_user": user,
-            "current_role": role,
-        },
-    )
+    def __init__(self, url: str):
+        self.url = url
 
 
-@router.get("/affected", include_in_schema=False)
-def affected_dashboard(
-    request: Request,
-    current: CurrentUserRoleDep,
-):
-    user = current["user"]
-    role = current["role"]
+async def page_redirect_handler(request: Request, exc: PageRedirect) -> RedirectResponse:
+    return RedirectResponse(url=exc.url, status_code=303)
 
-    if role != "affected":
-        return RedirectResponse(url="/", status_code=303)
 
-    return templates.TemplateResponse(
-        "affected_dashboard.html",
-        {
-            "request": request,
-            "current_user": user,
-            "current_role": role,
-        },
-    )
+def require_role(role: str):
+    """
+    Dependency factory for HTML pages: returns {"user", "role"} when the
+    active role matches, otherwise redirects to the home page.
+    """
+    async def dependency(current: CurrentUserRoleDep) -> dict:
+        if current["role"] != role:
+            raise PageRedirect("/")
+        return current
+
+    return dependency
+
+
+DonorPageDep = Annotated[dict, Depends(require_role("donor"))]
+AffectedPageDep = Annotated[dict, Depends(require_role("affected"))]
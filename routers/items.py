@@ -3,41 +3,46 @@
 from typing import Optional, List
 
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlmodel import select
+from pydantic import ValidationError
+from sqlmodel import delete, select
 
 from db import SessionDep
-from models import Item, User, Request
+from models import Item, ItemRequest, User
 from schemas import ItemCreate
+from templating import templates
 from .auth import UserRoleDep
+from .requests import invalidate_request_cache
 
 router = APIRouter(tags=["items"])
 
-templates = Jinja2Templates(directory="templates")
-
 
 
 @router.get("/{item_id}", response_model=Item)
-def get_item(item_id: int, session: SessionDep):
+async def get_item(item_id: int, session: SessionDep):
     """
     Get a single item by ID.
     """
-    item = session.get(Item, item_id)
+    item = await session.get(Item, item_id)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     return item
 
 
 @router.post("/", response_model=Item)
-def create_item(item_in: ItemCreate, session: SessionDep):
+async def create_item(item_in: ItemCreate, session: SessionDep):
     """
     Create a new item batch for a donor.
     If an identical batch already exists, increase its quantity instead.
     """
+    return await _create_or_bump_item(session, item_in)
+
+
+async def _create_or_bump_item(session: SessionDep, item_in: ItemCreate) -> Item:
 
     # 1) Check donor exists and is flagged as donor
-    donor = session.get(User, item_in.donor_id)
+    donor = await session.get(User, item_in.donor_id)
     if donor is None or not donor.is_donor:
         raise HTTPException(
             status_code=400,
@@ -52,7 +57,7 @@ def create_item(item_in: ItemCreate, session: SessionDep):
         Item.location == item_in.location,
         Item.description == item_in.description,
     )
-    existing = session.exec(query).first()
+    existing = (await session.exec(query)).first()
 
     # 3) If found, just bump quantity
     if existing:
@@ -63,8 +68,7 @@ def create_item(item_in: ItemCreate, session: SessionDep):
             existing.status = "Available"
 
         session.add(existing)
-        session.commit()
-        session.refresh(existing)
+        await session.commit()
         return existing
 
     # 4) Otherwise create a brand new item
@@ -78,14 +82,14 @@ def create_item(item_in: ItemCreate, session: SessionDep):
         status="Available",
     )
 
+    # The generated id comes back with the INSERT, no refresh needed
     session.add(item)
-    session.commit()
-    session.refresh(item)
+    await session.commit()
     return item
 
 
 @router.get("/", response_model=List[Item])
-def list_items(
+async def list_items(
     session: SessionDep,
     category: Optional[str] = None,
     location: Optional[str] = None,
@@ -109,12 +113,12 @@ def list_items(
     if min_quantity is not None:
         query = query.where(Item.quantity >= min_quantity)
 
-    results = session.exec(query).all()
+    results = (await session.exec(query)).all()
     return results
 
 
 @router.delete("/{item_id}")
-def delete_item(
+async def delete_item(
     item_id: int,
     session: SessionDep,
     current: UserRoleDep,
@@ -129,7 +133,7 @@ def delete_item(
             detail="Only donors can delete items.",
         )
 
-    item = session.get(Item, item_id)
+    item = await session.get(Item, item_id)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
 
@@ -146,25 +150,24 @@ def delete_item(
             detail="Completed items cannot be deleted.",
         )
 
-    # If you also want to clean up old non-pending requests, you *can* do:
-    old_requests = session.exec(select(Request).where(Request.item_id == item_id)).all()
-    for r in old_requests:
-        session.delete(r)
+    # Clean up every request for this item in one statement
+    await session.exec(delete(ItemRequest).where(ItemRequest.item_id == item_id))
 
-    session.delete(item)
-    session.commit()
+    await session.delete(item)
+    await session.commit()
+    invalidate_request_cache()
     return {"detail": "Item deleted successfully"}
 
 @router.get("/my", response_class=HTMLResponse)
-def my_items_page(request: Request, session: SessionDep, current: UserRoleDep):
+async def my_items_page(request: Request, session: SessionDep, current: UserRoleDep):
     user = current["user"]
     role = current["role"]
 
     if role != "donor":
         raise HTTPException(status_code=403, detail="Only donors can view this page.")
 
-    items = session.exec(
-        select(Item).where(Item.donor_id == user.id)
+    items = (
+        await session.exec(select(Item).where(Item.donor_id == user.id))
     ).all()
 
     return templates.TemplateResponse(
@@ -182,32 +185,20 @@ async def create_item_from_form(request: Request, session: SessionDep, current:
 
     form = await request.form() # type: ignore
 
-    name = form.get("name")
-    category = form.get("category")
-    quantity_raw = form.get("quantity")
-    description = form.get("description")
-    location = form.get("location")
-
-    if not all([name, category, quantity_raw, description, location]):
-        raise HTTPException(status_code=400, detail="All fields required")
-
-    quantity = int(quantity_raw)
-
-    item_in = ItemCreate(
-        donor_id=user.id,
-        name=name,
-        category=category,
-        quantity=quantity,
-        description=description,
-        location=location,
-    )
+    # Blank inputs are dropped so Pydantic reports them as missing
+    data = {key: value for key, value in form.items() if value}
+    data["donor_id"] = user.id
+    try:
+        item_in = ItemCreate.model_validate(data)
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors())
 
-    create_item(item_in=item_in, session=session)
+    await _create_or_bump_item(session, item_in)
 
     return RedirectResponse(url="/items/my", status_code=303)
 
 @router.get("/new", response_class=HTMLResponse)
-def new_item_page(request: Request, current: UserRoleDep):
+async def new_item_page(request: Request, current: UserRoleDep):
     user = current["user"]
     role = current["role"]
 
@@ -1,19 +1,18 @@
 # routers/pages.py
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse
+from templating import templates
 
 # Import the correct dependencies from your auth.py
-from .auth import CurrentUserRoleDep
+from .auth import AffectedPageDep, DonorPageDep
 
 router = APIRouter(tags=["pages"])
-templates = Jinja2Templates(directory="templates")
 
 
 @router.get("/affected/requests", response_class=HTMLResponse)
 async def affected_requests_page(
     request: Request,
-    current: CurrentUserRoleDep
+    current: AffectedPageDep
 ):
     """
     Display the affected user's request tracking page.
@@ -22,11 +21,6 @@ async def affected_requests_page(
     user = current["user"]
     role = current["role"]
 
-    # Check if user is an affected user
-    if role != "affected":
-        # Redirect to home or appropriate dashboard
-        return RedirectResponse(url="/", status_code=303)
-
     return templates.TemplateResponse(
         "affected_requests.html",
         {
@@ -42,15 +36,12 @@ async def affected_requests_page(
 @router.get("/donor", response_class=HTMLResponse)
 async def donor_dashboard(
     request: Request,
-    current: CurrentUserRoleDep
+    current: DonorPageDep
 ):
     """Donor dashboard page"""
     user = current["user"]
     role = current["role"]
 
-    if role != "donor":
-        return RedirectResponse(url="/", status_code=303)
-
     return templates.TemplateResponse(
         "donor_dashboard.html",
         {
@@ -64,15 +55,12 @@ async def donor_dashboard(
 @router.get("/affected", response_class=HTMLResponse)
 async def affected_dashboard(
     request: Request,
-    current: CurrentUserRoleDep
+    current: AffectedPageDep
 ):
     """Affected user dashboard page"""
     user = current["user"]
     role = current["role"]
 
-    if role != "affected":
-        return RedirectResponse(url="/", status_code=303)
-
     return templates.TemplateResponse(
         "affected_dashboard.html",
         {
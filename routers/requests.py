@@ -1,42 +1,151 @@
-from typing import Optional, List
+from contextlib import asynccontextmanager
+from typing import Annotated, Optional, List
 
-from fastapi import APIRouter, HTTPException, Response
+from cachetools import TTLCache
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy import exists, lambda_stmt
+from sqlalchemy.orm import load_only, raiseload
 from sqlmodel import select
 
 from db import SessionDep
-from models import Request as RequestModel, Item, User, Request
+from etags import conditional_response, entity_response, json_entity
+from models import ItemRequest as RequestModel, Item, User
 from schemas import RequestCreate, RequestStatusUpdate
-from .auth import UserRoleDep
+from .auth import SessionRoleDep, UserRoleDep
 
 router = APIRouter(tags=["requests"])
 
+# request_id -> (JSON body, ETag) for GET /requests/{id}. Only touched
+# from handlers on the event loop, so no lock is needed.
+_request_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
 
-def _refresh_item_status(session: SessionDep, item: Item) -> None:
+
+def invalidate_request_cache(request_id: Optional[int] = None) -> None:
+    """Forget one cached request, or all of them after a bulk delete."""
+    if request_id is None:
+        _request_cache.clear()
+    else:
+        _request_cache.pop(request_id, None)
+
+
+# (role, action) -> (check over user/request/item, 403 detail when it fails).
+# A role with no entry for an action may not perform it at all.
+_PERMISSIONS = {
+    ("donor", "update"): (
+        lambda user, req, item: item.donor_id == user.id,
+        "You can only manage requests for your own items.",
+    ),
+    ("donor", "delete"): (
+        lambda user, req, item: item.donor_id == user.id,
+        "Donors can only delete requests for their items.",
+    ),
+    ("affected", "delete"): (
+        lambda user, req, item: req.requester_id == user.id,
+        "You can only delete your own requests.",
+    ),
+}
+
+
+def _check_permission(role: str, action: str, user, req: RequestModel, item: Item) -> None:
+    rule = _PERMISSIONS.get((role, action))
+    if rule is None:
+        raise HTTPException(status_code=403, detail=f"Your role cannot {action} requests")
+    allowed, detail = rule
+    if not allowed(user, req, item):
+        raise HTTPException(status_code=403, detail=detail)
+
+
+def _role_may(action: str, detail: str):
+    """
+    Dependency that rejects roles with no rule for `action` using only the
+    session token. Declare it before UserRoleDep so the 403 comes first.
+    """
+    async def check(role: SessionRoleDep) -> str:
+        if (role, action) not in _PERMISSIONS:
+            raise HTTPException(status_code=403, detail=detail)
+        return role
+
+    return Depends(check)
+
+
+@asynccontextmanager
+async def _unit_of_work(session: SessionDep):
+    """
+    Commit once on exit, roll back if the block raises. Uses
+    session.begin() unless a transaction is already open (the session
+    dependency autobegins one when it loads the user).
+    """
+    if not session.in_transaction():
+        async with session.begin():
+            yield
+        return
+    try:
+        yield
+    except BaseException:
+        await session.rollback()
+        raise
+    await session.commit()
+
+
+async def _refresh_item_status(session: SessionDep, item: Item) -> None:
     if item.id is None:
         return
     if item.quantity <= 0:
         item.status = "Completed"
         return
-    has_pending = session.exec(
-        select(RequestModel.id).where(
-            RequestModel.item_id == item.id,
-            RequestModel.status == "Pending",
+    item_id = item.id
+    has_pending = await session.scalar(
+        lambda_stmt(
+            lambda: select(
+                exists().where(
+                    RequestModel.item_id == item_id,
+                    RequestModel.status == "Pending",
+                )
+            )
         )
-    ).first()
+    )
     item.status = "Requested" if has_pending else "Available"
 
 
+async def _load_item_for_write(session: SessionDep, item_id: int) -> Optional[Item]:
+    # The write paths only read and bump these columns; skip the text ones
+    return (
+        await session.scalars(
+            select(Item)
+            .options(load_only(Item.id, Item.donor_id, Item.quantity, Item.status))
+            .where(Item.id == item_id)
+        )
+    ).first()
+
+
 @router.get("/{request_id}", response_model=RequestModel)
-def get_request(request_id: int, session: SessionDep):
-    req = session.get(RequestModel, request_id)
-    if req is None:
-        raise HTTPException(status_code=404, detail="Request not found")
-    return req
+async def get_request(request_id: int, request: Request, session: SessionDep):
+    entry = _request_cache.get(request_id)
+    if entry is None:
+        req = await session.get(RequestModel, request_id)
+        if req is None:
+            raise HTTPException(status_code=404, detail="Request not found")
+        entry = _request_cache[request_id] = json_entity(req.model_dump())
+
+    return entity_response(request, *entry)
 
 
 @router.post("/", response_model=RequestModel)
-def create_request(request_data: RequestCreate, session: SessionDep):
-    item = session.get(Item, request_data.item_id)
+async def create_request(request_data: RequestCreate, session: SessionDep):
+    # Item and requester in one round-trip; only the error path
+    # goes back to the database to tell which of the two is missing.
+    row = (
+        await session.exec(
+            select(Item, User)
+            .join(User, User.id == request_data.requester_id)
+            .where(Item.id == request_data.item_id)
+        )
+    ).first()
+    if row is not None:
+        item, requester = row
+    else:
+        item, requester = await session.get(Item, request_data.item_id), None
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     if request_data.requested_quantity > item.quantity:
@@ -44,7 +153,6 @@ def create_request(request_data: RequestCreate, session: SessionDep):
             status_code=400,
             detail="Requested quantity exceeds available quantity",
         )
-    requester = session.get(User, request_data.requester_id)
     if requester is None:
         raise HTTPException(status_code=404, detail="Requester not found")
     new_request = RequestModel(
@@ -56,108 +164,110 @@ def create_request(request_data: RequestCreate, session: SessionDep):
     if item.status == "Available":
         item.status = "Requested"
         session.add(item)
+    # Item update and INSERT go out in one flush/transaction. Every column
+    # is set client-side and the id comes back from the INSERT, so no
+    # refresh() SELECT is needed afterwards.
     session.add(new_request)
-    session.commit()
-    session.refresh(new_request)
+    await session.commit()
     return new_request
 
 
 @router.get("/", response_model=List[RequestModel])
-def list_requests(
+async def list_requests(
+    request: Request,
     session: SessionDep,
     requester_id: Optional[int] = None,
     item_id: Optional[int] = None,
     status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
 ):
-    query = select(RequestModel)
+    # Each optional filter is its own cached lambda, so every
+    # combination of filters compiles once and is reused.
+    query = lambda_stmt(lambda: select(RequestModel).options(raiseload("*")))
     if requester_id is not None:
-        query = query.where(RequestModel.requester_id == requester_id)
+        query += lambda q: q.where(RequestModel.requester_id == requester_id)
     if item_id is not None:
-        query = query.where(RequestModel.item_id == item_id)
+        query += lambda q: q.where(RequestModel.item_id == item_id)
     if status is not None:
-        query = query.where(RequestModel.status == status)
-    return session.exec(query).all()
+        query += lambda q: q.where(RequestModel.status == status)
+    # Newest first, one bounded page at a time
+    query += lambda q: q.order_by(RequestModel.id.desc()).offset(offset).limit(limit)
+    rows = (await session.scalars(query)).all()
+    return conditional_response(
+        request, JSONResponse([row.model_dump() for row in rows])
+    )
 
 
 @router.patch("/{request_id}", response_model=RequestModel)
-def update_request_status(
+async def update_request_status(
     request_id: int,
     update: RequestStatusUpdate,
     session: SessionDep,
+    role: Annotated[str, _role_may("update", "Only donors can update requests")],
     current: UserRoleDep,
 ):
     user = current["user"]
-    role = current["role"]
-    if role != "donor":
-        raise HTTPException(status_code=403, detail="Only donors can update requests")
-    db_request = session.get(RequestModel, request_id)
-    if db_request is None:
-        raise HTTPException(status_code=404, detail="Request not found")
-    item = session.get(Item, db_request.item_id)
-    if item is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Associated item not found",
-        )
-    if item.donor_id != user.id:
-        raise HTTPException(
-            status_code=403,
-            detail="You can only manage requests for your own items.",
-        )
-    if db_request.status != "Pending":
-        raise HTTPException(
-            status_code=400,
-            detail="Only pending requests can be updated",
-        )
-    if update.status == "Approved":
-        if db_request.requested_quantity > item.quantity:
+    async with _unit_of_work(session):
+        db_request = await session.get(RequestModel, request_id)
+        if db_request is None:
+            raise HTTPException(status_code=404, detail="Request not found")
+        item = await _load_item_for_write(session, db_request.item_id)
+        if item is None:
             raise HTTPException(
                 status_code=400,
-                detail="Not enough quantity available",
+                detail="Associated item not found",
             )
-        item.quantity -= db_request.requested_quantity
-        db_request.status = "Approved"
-    elif update.status == "Rejected":
-        db_request.status = "Rejected"
-    _refresh_item_status(session, item)
-    session.add(item)
-    session.add(db_request)
-    session.commit()
-    session.refresh(db_request)
+        _check_permission(role, "update", user, db_request, item)
+        if db_request.status != "Pending":
+            raise HTTPException(
+                status_code=400,
+                detail="Only pending requests can be updated",
+            )
+        if update.status == "Approved":
+            if db_request.requested_quantity > item.quantity:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Not enough quantity available",
+                )
+            item.quantity -= db_request.requested_quantity
+            db_request.status = "Approved"
+        elif update.status == "Rejected":
+            db_request.status = "Rejected"
+        await _refresh_item_status(session, item)
+    invalidate_request_cache(request_id)
     return db_request
 
 
 @router.delete("/{request_id}", status_code=204)
-def delete_request(
+async def delete_request(
     request_id: int,
     session: SessionDep,
+    role: Annotated[str, _role_may("delete", "Your role cannot delete requests")],
     current: UserRoleDep,
 ):
     user = current["user"]
-    role = current["role"]
-    req = session.get(Request, request_id)
+    req = (
+        await session.scalars(
+            select(RequestModel)
+            .options(
+                load_only(RequestModel.id, RequestModel.item_id, RequestModel.requester_id)
+            )
+            .where(RequestModel.id == request_id)
+        )
+    ).first()
     if req is None:
         raise HTTPException(status_code=404, detail="Request not found")
-    item = session.get(Item, req.item_id)
+    item = await _load_item_for_write(session, req.item_id)
     if item is None:
         raise HTTPException(
             status_code=400,
             detail="Associated item not found",
         )
-    if role == "affected":
-        if req.requester_id != user.id:
-            raise HTTPException(
-                status_code=403,
-                detail="You can only delete your own requests.",
-            )
-    elif role == "donor":
-        if item.donor_id != user.id:
-            raise HTTPException(
-                status_code=403,
-                detail="Donors can only delete requests for their items.",
-            )
-    session.delete(req)
-    _refresh_item_status(session, item)
+    _check_permission(role, "delete", user, req, item)
+    await session.delete(req)
+    await _refresh_item_status(session, item)
     session.add(item)
-    session.commit()
+    await session.commit()
+    invalidate_request_cache(request_id)
     return Response(status_code=204)
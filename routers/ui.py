@@ -1,55 +1,111 @@
 import json
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, Request, status
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from sqlmodel import select
+from pydantic import ValidationError
+from sqlalchemy import func, lambda_stmt
+from sqlalchemy.orm import raiseload
+from sqlmodel import delete, select
 
 from db import SessionDep
-from models import Item, Request as RequestModel, User
-from schemas import ItemCreate
+from etags import conditional_response
+from models import Item, ItemRequest as RequestModel, User
+from schemas import DonorItemForm, ItemCreate
+from templating import templates
 from .auth import UserRoleDep
-from .items import create_item as api_create_item
-from .requests import _refresh_item_status
+from .items import _create_or_bump_item
+from .requests import (
+    _check_permission,
+    _refresh_item_status,
+    _unit_of_work,
+    invalidate_request_cache,
+)
 
 router = APIRouter(prefix="/ui", tags=["ui"])
-templates = Jinja2Templates(directory="templates")
+
+# Fragments differ per logged-in donor, so keep them out of shared caches
+_FRAGMENT_CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Cookie"}
+
+# Fragments are rendered on every htmx swap; resolve them once at import
+# instead of going through the loader on each TemplateResponse.
+_ITEMS_TPL = templates.get_template("fragments/donor_items_list.html")
+_DONATE_FORM_TPL = templates.get_template("fragments/donor_donate_form.html")
+_REQUESTS_TPL = templates.get_template("fragments/donor_requests_list.html")
 
 
 FLASH_SUCCESS = "success"
 FLASH_ERROR = "error"
 
+_REQUIRED_FIELDS = (
+    ("name", "Item name"),
+    ("category", "Category"),
+    ("quantity", "Quantity"),
+    ("location", "Location"),
+    ("description", "Description"),
+)
+_REQUIRED_ERRORS = {field: f"{label} is required." for field, label in _REQUIRED_FIELDS}
+_QUANTITY_ERRORS = {
+    "int_parsing": "Quantity must be an integer.",
+    "greater_than_equal": "Quantity must be at least 1.",
+}
+
+
+def _form_error_message(error: dict) -> str:
+    """Map a DonorItemForm validation error to the message shown in the form."""
+    field = error["loc"][0]
+    if error["type"] in ("missing", "string_too_short"):
+        return _REQUIRED_ERRORS[field]
+    if field == "quantity":
+        return _QUANTITY_ERRORS.get(error["type"], error["msg"])
+    return error["msg"]
+
 
 def _ensure_donor(role: str) -> None:
     if role != "donor":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only donors can access this section.")
 
 
-def _load_donor_items(session: SessionDep, donor_id: int) -> List[Item]:
-    stmt = select(Item).where(Item.donor_id == donor_id).order_by(Item.id.desc())
-    return session.exec(stmt).all()
+async def _load_donor_items(session: SessionDep, donor_id: int) -> List[Tuple[Item, int]]:
+    # Pending-request counts are aggregated in the same query, so the page
+    # costs one round trip however many items the donor has.
+    stmt = lambda_stmt(
+        lambda: select(
+            Item,
+            func.count(RequestModel.id)
+            .filter(RequestModel.status == "Pending")
+            .label("pending_count"),
+        )
+        .options(raiseload("*"))
+        .outerjoin(RequestModel, RequestModel.item_id == Item.id)
+        .where(Item.donor_id == donor_id)
+        .group_by(Item.id)
+        .order_by(Item.id.desc())
+    )
+    return (await session.exec(stmt)).all()
 
 
 def _render_items_fragment(
     request: Request,
-    items: List[Item],
+    items: List[Tuple[Item, int]],
     flash_message: Optional[dict] = None,
 ) -> HTMLResponse:
-    return templates.TemplateResponse(
-        "fragments/donor_items_list.html",
-        {"request": request, "items": items, "flash_message": flash_message},
+    return HTMLResponse(
+        _ITEMS_TPL.render({"request": request, "items": items, "flash_message": flash_message})
     )
 
 
-def _load_request_rows(session: SessionDep, item_id: int) -> List[dict]:
-    stmt = (
-        select(RequestModel, User.name)
+async def _load_request_rows(session: SessionDep, item_id: int) -> List[dict]:
+    # The requester name comes from the JOIN; raiseload keeps any
+    # relationship access in the template from lazy-loading per row.
+    stmt = lambda_stmt(
+        lambda: select(RequestModel, User.name)
+        .options(raiseload("*"))
         .join(User, User.id == RequestModel.requester_id)
         .where(RequestModel.item_id == item_id)
         .order_by(RequestModel.id.desc())
     )
-    rows = session.exec(stmt).all()
+    rows = (await session.exec(stmt)).all()
     formatted = []
     for req, requester_name in rows:
         formatted.append({"model": req, "requester_name": requester_name})
@@ -63,21 +119,41 @@ def _render_requests_fragment(
     modal_message: Optional[dict] = None,
     status_code: int = status.HTTP_200_OK,
 ) -> HTMLResponse:
-    response = templates.TemplateResponse(
-        "fragments/donor_requests_list.html",
-        {
-            "request": request,
-            "item": item,
-            "requests": requests_data,
-            "modal_message": modal_message,
-        },
+    return HTMLResponse(
+        _REQUESTS_TPL.render(
+            {
+                "request": request,
+                "item": item,
+                "requests": requests_data,
+                "modal_message": modal_message,
+            }
+        ),
+        status_code=status_code,
+    )
+
+
+def _render_donate_form(
+    request: Request,
+    form_data: Optional[dict] = None,
+    errors: Optional[List[str]] = None,
+    flash_message: Optional[dict] = None,
+    status_code: int = status.HTTP_200_OK,
+) -> HTMLResponse:
+    return HTMLResponse(
+        _DONATE_FORM_TPL.render(
+            {
+                "request": request,
+                "form_data": form_data or {},
+                "errors": errors or [],
+                "flash_message": flash_message,
+            }
+        ),
+        status_code=status_code,
     )
-    response.status_code = status_code
-    return response
 
 
 @router.get("/donor/items", response_class=HTMLResponse)
-def donor_items_fragment(
+async def donor_items_fragment(
     request: Request,
     session: SessionDep,
     current: UserRoleDep,
@@ -85,24 +161,20 @@ def donor_items_fragment(
     user = current["user"]
     role = current["role"]
     _ensure_donor(role)
-    items = _load_donor_items(session, user.id)
-    return _render_items_fragment(request, items)
+    items = await _load_donor_items(session, user.id)
+    return conditional_response(
+        request, _render_items_fragment(request, items), _FRAGMENT_CACHE_HEADERS
+    )
 
 
 @router.get("/donor/donate-form", response_class=HTMLResponse)
-def donor_donate_form(
+async def donor_donate_form(
     request: Request,
     current: UserRoleDep,
 ):
     _ensure_donor(current["role"])
-    return templates.TemplateResponse(
-        "fragments/donor_donate_form.html",
-        {
-            "request": request,
-            "form_data": {},
-            "errors": [],
-            "flash_message": None,
-        },
+    return conditional_response(
+        request, _render_donate_form(request), _FRAGMENT_CACHE_HEADERS
     )
 
 
@@ -117,80 +189,33 @@ async def donor_create_item(
     _ensure_donor(role)
 
     form = await request.form()
-    form_data = {
-        "name": (form.get("name") or "").strip(),
-        "category": (form.get("category") or "").strip(),
-        "quantity": (form.get("quantity") or "").strip(),
-        "location": (form.get("location") or "").strip(),
-        "description": (form.get("description") or "").strip(),
-    }
-
-    errors: List[str] = []
-
-    for field, label in (
-        ("name", "Item name"),
-        ("category", "Category"),
-        ("quantity", "Quantity"),
-        ("location", "Location"),
-        ("description", "Description"),
-    ):
-        if not form_data[field]:
-            errors.append(f"{label} is required.")
-
-    quantity_value: Optional[int] = None
-    if form_data["quantity"]:
-        try:
-            quantity_value = int(form_data["quantity"])
-            if quantity_value < 1:
-                errors.append("Quantity must be at least 1.")
-        except ValueError:
-            errors.append("Quantity must be an integer.")
-
-    if errors:
-        response = templates.TemplateResponse(
-            "fragments/donor_donate_form.html",
-            {
-                "request": request,
-                "form_data": form_data,
-                "errors": errors,
-                "flash_message": None,
-            },
+    # Stripped input, echoed back into the form if validation fails
+    form_data = {field: (form.get(field) or "").strip() for field, _ in _REQUIRED_FIELDS}
+
+    try:
+        # Blank inputs are dropped so they are reported as missing
+        item_form = DonorItemForm.model_validate({k: v for k, v in form_data.items() if v})
+    except ValidationError as exc:
+        return _render_donate_form(
+            request,
+            form_data,
+            [_form_error_message(err) for err in exc.errors()],
+            status_code=status.HTTP_400_BAD_REQUEST,
         )
-        response.status_code = status.HTTP_400_BAD_REQUEST
-        return response
 
-    item_in = ItemCreate(
-        donor_id=user.id,
-        name=form_data["name"],
-        category=form_data["category"],
-        quantity=quantity_value or 1,
-        description=form_data["description"],
-        location=form_data["location"],
-    )
+    item_in = ItemCreate(donor_id=user.id, **item_form.model_dump())
 
     try:
-        api_create_item(item_in=item_in, session=session)
+        await _create_or_bump_item(session, item_in)
     except HTTPException as exc:
-        errors.append(exc.detail)
-        response = templates.TemplateResponse(
-            "fragments/donor_donate_form.html",
-            {
-                "request": request,
-                "form_data": form_data,
-                "errors": errors,
-                "flash_message": None,
-            },
+        return _render_donate_form(
+            request, form_data, [exc.detail], status_code=exc.status_code
         )
-        response.status_code = exc.status_code
-        return response
 
-    context = {
-        "request": request,
-        "form_data": {},
-        "errors": [],
-        "flash_message": {"kind": FLASH_SUCCESS, "text": "Item donated successfully."},
-    }
-    response = templates.TemplateResponse("fragments/donor_donate_form.html", context)
+    response = _render_donate_form(
+        request,
+        flash_message={"kind": FLASH_SUCCESS, "text": "Item donated successfully."},
+    )
     response.headers["HX-Trigger"] = json.dumps(
         {"donor-items-refresh": True, "close-donate-modal": True}
     )
@@ -198,7 +223,7 @@ async def donor_create_item(
 
 
 @router.post("/donor/items/{item_id}/delete", response_class=HTMLResponse)
-def donor_delete_item(
+async def donor_delete_item(
     item_id: int,
     request: Request,
     session: SessionDep,
@@ -209,7 +234,7 @@ def donor_delete_item(
     _ensure_donor(role)
 
     try:
-        item = session.get(Item, item_id)
+        item = await session.get(Item, item_id)
         if item is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found.")
         if item.donor_id != user.id:
@@ -217,16 +242,15 @@ def donor_delete_item(
         if item.status == "Completed":
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Completed items cannot be deleted.")
 
-        old_requests = session.exec(select(RequestModel).where(RequestModel.item_id == item_id)).all()
-        for req in old_requests:
-            session.delete(req)
+        await session.exec(delete(RequestModel).where(RequestModel.item_id == item_id))
 
-        session.delete(item)
-        session.commit()
+        await session.delete(item)
+        await session.commit()
+        invalidate_request_cache()
         flash_message = {"kind": FLASH_SUCCESS, "text": "Item deleted successfully."}
     except HTTPException as exc:
-        session.rollback()
-        items = _load_donor_items(session, user.id)
+        await session.rollback()
+        items = await _load_donor_items(session, user.id)
         response = _render_items_fragment(
             request,
             items,
@@ -235,12 +259,12 @@ def donor_delete_item(
         response.status_code = exc.status_code
         return response
 
-    items = _load_donor_items(session, user.id)
+    items = await _load_donor_items(session, user.id)
     return _render_items_fragment(request, items, flash_message)
 
 
 @router.get("/donor/items/{item_id}/requests", response_class=HTMLResponse)
-def donor_item_requests(
+async def donor_item_requests(
     item_id: int,
     request: Request,
     session: SessionDep,
@@ -250,7 +274,7 @@ def donor_item_requests(
     role = current["role"]
     _ensure_donor(role)
 
-    item = session.get(Item, item_id)
+    item = await session.get(Item, item_id)
     if item is None or item.donor_id != user.id:
         return _render_requests_fragment(
             request,
@@ -260,8 +284,12 @@ def donor_item_requests(
             status_code=status.HTTP_404_NOT_FOUND,
         )
 
-    requests_data = _load_request_rows(session, item_id)
-    return _render_requests_fragment(request, item, requests_data)
+    requests_data = await _load_request_rows(session, item_id)
+    return conditional_response(
+        request,
+        _render_requests_fragment(request, item, requests_data),
+        _FRAGMENT_CACHE_HEADERS,
+    )
 
 
 @router.post("/donor/requests/{request_id}/status", response_class=HTMLResponse)
@@ -284,38 +312,38 @@ async def donor_update_request_status(
         if new_status not in {"Approved", "Rejected"}:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid status value.")
 
-        db_request = session.get(RequestModel, request_id)
-        if db_request is None:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Request not found.")
-
-        item = session.get(Item, db_request.item_id)
-        if item is None:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Associated item not found.")
-        if item.donor_id != user.id:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You can only manage requests for your own items.")
-        if db_request.status != "Pending":
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only pending requests can be updated.")
-
-        if new_status == "Approved":
-            if db_request.requested_quantity > item.quantity:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough quantity available.")
-            item.quantity -= db_request.requested_quantity
-            db_request.status = "Approved"
-        else:
-            db_request.status = "Rejected"
-
-        _refresh_item_status(session, item)
-        session.add(item)
-        session.add(db_request)
-        session.commit()
-        session.refresh(db_request)
+        async with _unit_of_work(session):
+            db_request = await session.get(RequestModel, request_id)
+            if db_request is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Request not found.")
+
+            item = await session.get(Item, db_request.item_id)
+            if item is None:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Associated item not found.")
+            _check_permission(role, "update", user, db_request, item)
+            if db_request.status != "Pending":
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only pending requests can be updated.")
+
+            if new_status == "Approved":
+                if db_request.requested_quantity > item.quantity:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough quantity available.")
+                item.quantity -= db_request.requested_quantity
+                db_request.status = "Approved"
+            else:
+                db_request.status = "Rejected"
+
+            await _refresh_item_status(session, item)
+        invalidate_request_cache(request_id)
         modal_message = {
             "kind": FLASH_SUCCESS,
             "text": f"Request {new_status.lower()} successfully.",
         }
     except HTTPException as exc:
-        session.rollback()
-        requests_data = _load_request_rows(session, item.id) if item else []
+        requests_data = []
+        if item is not None:
+            # The rollback expired the item; reload it before rendering
+            await session.refresh(item)
+            requests_data = await _load_request_rows(session, item.id)
         response = _render_requests_fragment(
             http_request,
             item,
@@ -325,7 +353,7 @@ async def donor_update_request_status(
         )
         return response
 
-    requests_data = _load_request_rows(session, item.id)
+    requests_data = await _load_request_rows(session, item.id)
     response = _render_requests_fragment(http_request, item, requests_data, modal_message)
     response.headers["HX-Trigger"] = json.dumps({"donor-items-refresh": True})
     return response
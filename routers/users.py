@@ -1,72 +1,82 @@
 # routers/users.py
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, HTTPException, Response
-from sqlmodel import select
-from .auth import UserRoleDep
+from cachetools import TTLCache
+from fastapi import APIRouter, Cookie, HTTPException, Request, Response
+from sqlmodel import delete, select
+from .auth import UserRoleDep, forget_session
+from .requests import invalidate_request_cache
 from db import SessionDep
-from models import User, Item, Request
+from etags import entity_response, json_entity
+from models import User, Item, ItemRequest
 from schemas import UserRead
 
 router = APIRouter(tags=["users"])
 
+# user_id -> (JSON body, ETag) of its UserRead for GET /users/{id}
+_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+
 
 @router.get("/", response_model=List[UserRead])
-def list_users(session: SessionDep):
+async def list_users(session: SessionDep):
     """
     List all users (debug/admin).
     """
-    users = session.exec(select(User)).all()
+    users = (await session.exec(select(User))).all()
     return users
 
 
 @router.get("/{user_id}", response_model=UserRead)
-def get_user(user_id: int, session: SessionDep):
+async def get_user(user_id: int, request: Request, session: SessionDep):
     """
     Get a single user by ID.
     """
-    user = session.get(User, user_id)
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+    entry = _user_cache.get(user_id)
+    if entry is None:
+        user = await session.get(User, user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        entry = _user_cache[user_id] = json_entity(
+            UserRead.model_validate(user).model_dump()
+        )
+
+    return entity_response(request, *entry)
 
 
 @router.delete("/me", status_code=204)
-def delete_own_account(
+async def delete_own_account(
     session: SessionDep,
     current: UserRoleDep,
+    session_token: Optional[str] = Cookie(default=None, alias="session"),
 ):
-    user = current["user"]
-
-    if user.id is None:
-        # Shouldn't happen in practice, but just in case
-        raise HTTPException(status_code=400, detail="User has no id")
+    user_id = current["user"].id
+    # Nothing loaded here is reused, so skip syncing the identity map
+    no_sync = {"synchronize_session": False}
 
     # 1) Delete all requests *made by* this user
-    my_requests = session.exec(
-        select(Request).where(Request.requester_id == user.id)
-    ).all()
-    for req in my_requests:
-        session.delete(req)
+    await session.exec(
+        delete(ItemRequest).where(ItemRequest.requester_id == user_id),
+        execution_options=no_sync,
+    )
 
-    # 2) Find all items *donated by* this user
-    my_items = session.exec(
-        select(Item).where(Item.donor_id == user.id)
-    ).all()
+    # 2) Delete all requests for items *donated by* this user
+    my_item_ids = select(Item.id).where(Item.donor_id == user_id)
+    await session.exec(
+        delete(ItemRequest).where(ItemRequest.item_id.in_(my_item_ids)),
+        execution_options=no_sync,
+    )
 
-    # 3) For each of those items, delete all requests for that item,
-    #    then delete the item itself
-    for item in my_items:
-        item_reqs = session.exec(
-            select(Request).where(Request.item_id == item.id)
-        ).all()
-        for req in item_reqs:
-            session.delete(req)
-        session.delete(item)
+    # 3) Delete the items themselves
+    await session.exec(
+        delete(Item).where(Item.donor_id == user_id),
+        execution_options=no_sync,
+    )
 
     # 4) Finally, delete the user record itself
-    session.delete(user)
-    session.commit()
+    await session.exec(delete(User).where(User.id == user_id), execution_options=no_sync)
+    await session.commit()
+    forget_session(session_token)
+    _user_cache.pop(user_id, None)
+    invalidate_request_cache()
 
     return Response(status_code=204)
-
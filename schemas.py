@@ -11,6 +11,16 @@ class ItemCreate(BaseModel):
     description: str
     location: str
 
+class DonorItemForm(BaseModel):
+    """Donate form posted from the donor dashboard (donor_id comes from the session)."""
+    name: str = Field(min_length=1)
+    category: str = Field(min_length=1)
+    quantity: int = Field(ge=1)
+    location: str = Field(min_length=1)
+    description: str = Field(min_length=1)
+
+    model_config = ConfigDict(str_strip_whitespace=True)
+
 class RequestCreate(BaseModel):
     requester_id: int
     item_id: int
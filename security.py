@@ -0,0 +1,67 @@
+import logging
+import os
+import time
+
+from passlib.context import CryptContext
+from passlib.hash import argon2
+
+logger = logging.getLogger(__name__)
+
+# Target wall-clock cost of one password hash; 0 disables calibration.
+PASSWORD_HASH_TARGET_MS = int(os.getenv("PASSWORD_HASH_TARGET_MS", "250"))
+
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", str(64 * 1024)))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "2"))
+
+# Argon2id for new hashes; pbkdf2_sha256 is only kept so existing
+# hashes still verify and get upgraded on the next successful login.
+# Calibration can settle on a different time_cost per worker, so only
+# hashes below the configured floor count as outdated, not every mismatch
+# (otherwise workers would keep rehashing each other's logins).
+pwd_context = CryptContext(
+    schemes=["argon2", "pbkdf2_sha256"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+    argon2__min_desired_rounds=ARGON2_TIME_COST,
+    argon2__max_desired_rounds=argon2.max_rounds,
+)
+
+
+def _time_hash(trials: int = 3) -> float:
+    start = time.perf_counter()
+    for _ in range(trials):
+        pwd_context.hash("probe")
+    return (time.perf_counter() - start) / trials
+
+
+def calibrate_password_hashing() -> None:
+    """
+    Raise the Argon2 time_cost until one hash takes roughly
+    PASSWORD_HASH_TARGET_MS on this machine. Never goes below the
+    configured ARGON2_TIME_COST.
+    """
+    if PASSWORD_HASH_TARGET_MS <= 0:
+        return
+
+    target = PASSWORD_HASH_TARGET_MS / 1000
+    time_cost = ARGON2_TIME_COST
+    for candidate in (ARGON2_TIME_COST, 4, 6, 8, 12, 16, 24, 32):
+        if candidate < ARGON2_TIME_COST:
+            continue
+        time_cost = candidate
+        pwd_context.update(argon2__time_cost=time_cost)
+        elapsed = _time_hash()
+        if elapsed >= target:
+            break
+
+    logger.info(
+        "Password hashing calibrated: argon2 m=%d t=%d p=%d (%.0f ms/hash)",
+        ARGON2_MEMORY_COST,
+        time_cost,
+        ARGON2_PARALLELISM,
+        elapsed * 1000,
+    )
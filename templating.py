@@ -0,0 +1,39 @@
+import os
+import stat
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+
+# Set TEMPLATES_AUTO_RELOAD=1 while editing templates locally. The htmx
+# fragments pre-loaded in routers/ui.py still need a restart to pick up edits.
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "false").lower() in ("1", "true", "yes")
+# Unset: Jinja's own per-user, 0700 directory under the temp dir.
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR")
+
+
+def _bytecode_cache() -> FileSystemBytecodeCache:
+    if not JINJA_CACHE_DIR:
+        return FileSystemBytecodeCache()
+
+    # Cached bytecode is unmarshalled and run, so the directory must not
+    # be writable (or pre-creatable) by anyone else.
+    os.makedirs(JINJA_CACHE_DIR, mode=0o700, exist_ok=True)
+    if os.name != "nt":
+        st = os.lstat(JINJA_CACHE_DIR)
+        if (
+            not stat.S_ISDIR(st.st_mode)
+            or st.st_uid != os.getuid()
+            or stat.S_IMODE(st.st_mode) & 0o077
+        ):
+            raise RuntimeError(
+                f"JINJA_CACHE_DIR {JINJA_CACHE_DIR} must be a directory owned "
+                "by this user with mode 0700"
+            )
+    return FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+
+# One environment shared by every router, so each template is
+# loaded and compiled once per process.
+templates = Jinja2Templates(directory="templates")
+templates.env.auto_reload = TEMPLATES_AUTO_RELOAD
+templates.env.bytecode_cache = _bytecode_cache()